@@ -11,6 +11,7 @@ Author: Helen Lily Hu
 '''
 import bpy
 import mathutils
+import numpy as np
 
 
 def _getObjList(nameRoot):
@@ -46,16 +47,103 @@ def deselect(nameRoot):
         o.select_set(False)
 
 
+def _selectOnly(objs):
+    '''
+    Select only the objects in objs, and return the list of objects that
+    were selected before.
+    Helper for procedures in this module that run selection-based operators.
+
+    Parameter objs: objs is a list of objects
+    '''
+    selected= list(bpy.context.selected_objects)
+    for o in selected:
+        o.select_set(False)
+    for o in objs:
+        o.select_set(True)
+    return selected
+
+
+def _restoreSelection(objs, selected):
+    '''
+    Undo _selectOnly: deselect the objects in objs and select the objects
+    in selected again.
+
+    Parameter objs: objs is a list of objects
+    Parameter selected: selected is a list of objects
+    '''
+    for o in objs:
+        o.select_set(False)
+    for o in selected:
+        o.select_set(True)
+
+
+def _getMovable(objs):
+    '''
+    Return the objects in objs that do not have an ancestor in objs, since
+    those already move with their ancestor.
+    Helper for procedures in this module that move objects.
+
+    Parameter objs: objs is a list of objects
+    '''
+    inObjs= set(objs)
+    movable= []
+    for o in objs:
+        p= o.parent
+        while p is not None and p not in inObjs:
+            p= p.parent
+        if p is None:
+            movable.append(o)
+    return movable
+
+
+def _getUnlocked(objs):
+    '''
+    Return a (len(objs), 3) array that is 1 for every location axis of every
+    object in objs that is not locked, and 0 otherwise.
+    Helper for procedures in this module that move objects.
+
+    Parameter objs: objs is a list of objects
+    '''
+    return np.array([[not l for l in o.lock_location] for o in objs],
+        dtype= np.float32).reshape(-1, 3)
+
+
+def _toLocalOffsets(objs, offsets):
+    '''
+    Return a copy of offsets with every world space offset converted to an
+    offset of the matching object's location.
+    Helper for procedures in this module that move objects.
+
+    Parameter objs: objs is a list of objects
+    Parameter offsets: offsets is a (len(objs), 3) array
+    '''
+    local= np.array(offsets, dtype= np.float32)
+    for i, o in enumerate(objs):
+        if o.parent is not None:
+            m= (o.parent.matrix_world @ o.matrix_parent_inverse).inverted_safe().to_3x3()
+            local[i]= m @ mathutils.Vector(local[i])
+    return local
+
+
 def move(nameRoot, vector):
     '''
     Move all objects whose names begin with nameRoot by vector.
 
+    Locked location axes are not changed, and objects whose parent also
+    moves are left to follow it.
+
     Parameter nameRoot: nameRoot is a string
     Parameter vector: vector is a tuple or list of length 3
     '''
-    bpy.ops.object.select_all(action='DESELECT') #prevent unintentionally moving something
-    select(nameRoot)
-    bpy.ops.transform.translate(value= vector)
+    all= _getMovable(_getObjList(nameRoot))
+    #gather locations, offset them all at once, then write them back
+    locs= np.empty((len(all), 3), dtype= np.float32)
+    for i, o in enumerate(all):
+        locs[i]= o.location
+    offsets= np.tile(np.asarray(vector, dtype= np.float32), (len(all), 1))
+    locs += _toLocalOffsets(all, offsets) * _getUnlocked(all)
+    for i, o in enumerate(all):
+        o.location= locs[i]
 
 
 def move_towards(nameRoot, target, value):
@@ -64,19 +152,24 @@ def move_towards(nameRoot, target, value):
 
     Use a negative value to move objects away from target.
 
+    Directions are measured from each object's location. Locked location
+    axes are not changed, and objects whose parent also moves are left to
+    follow it.
+
     Parameter nameRoot: nameRoot is a string
     Parameter target: target is a tuple or list of length 3
     Parameter value: value is a number
     '''
-    bpy.ops.object.select_all(action='DESELECT') #prevent unintentionally moving something
-    targetV= mathutils.Vector(target)
-    all= _getObjList(nameRoot)
-    for o in all:
-        o.select_set(True)
-        vector= targetV - mathutils.Vector(o.location)
-        vector.normalize()
-        bpy.ops.transform.translate(value= vector * value)
-        o.select_set(False)
+    all= _getMovable(_getObjList(nameRoot))
+    #compute every object's new location at once, then write them directly;
+    #an operator call per object is very slow
+    locs= np.array([o.location for o in all], dtype= np.float32).reshape(-1, 3)
+    vectors= np.asarray(target, dtype= np.float32) - locs
+    lengths= np.linalg.norm(vectors, axis= 1, keepdims= True)
+    offsets= vectors / np.where(lengths == 0, 1, lengths) * value
+    locs += _toLocalOffsets(all, offsets) * _getUnlocked(all)
+    for o, loc in zip(all, locs):
+        o.location= loc
 
 
 def enable_rigidbody(nameRoot, type= 'ACTIVE'):
@@ -86,12 +179,18 @@ def enable_rigidbody(nameRoot, type= 'ACTIVE'):
     Parameter nameRoot: nameRoot is a string
     Parameter type: 'ACTIVE' or 'PASSIVE'
     '''
-    c= bpy.context.view_layer.objects
     all= _getObjList(nameRoot)
-    for o in all:
-        c.active= o
-        bpy.ops.rigidbody.object_add(type= type)
-    c.active= None
+    if not all:
+        return
+    selected= _selectOnly(all) #prevent unintentionally adding to something
+    c= bpy.context.view_layer.objects
+    c.active= all[0]
+    try:
+        #one operator call for every selected object
+        bpy.ops.rigidbody.objects_add(type= type)
+    finally:
+        c.active= None
+        _restoreSelection(all, selected)
 
 
 def disable_rigidbody(nameRoot):
@@ -102,12 +201,18 @@ def disable_rigidbody(nameRoot):
     Precondition: All objects whose names begin with nameRoot have rigidbody
     physics enabled.
     '''
-    c= bpy.context.view_layer.objects
     all= _getObjList(nameRoot)
-    for o in all:
-        c.active= o
-        bpy.ops.rigidbody.object_remove()
-    c.active= None
+    if not all:
+        return
+    selected= _selectOnly(all) #prevent unintentionally removing from something
+    c= bpy.context.view_layer.objects
+    c.active= all[0]
+    try:
+        #one operator call for every selected object
+        bpy.ops.rigidbody.objects_remove()
+    finally:
+        c.active= None
+        _restoreSelection(all, selected)
 
 
 def bake_rigidbody(nameRoot, startFrame= 1, endFrame= 250, step= 1):
@@ -115,15 +220,38 @@ def bake_rigidbody(nameRoot, startFrame= 1, endFrame= 250, step= 1):
     Bake rigidbody physics for all objects whose names begin with nameRoot
     from frameStart to frameEnd with step.
 
+    Objects that are not active rigid bodies are left untouched.
+
     Parameter nameRoot: nameRoot is a string
     Parameter startFrame: startFrame is an integer in 0..300000
     Parameter endFrame: endFrame is an integer in 1..300000
     Parameter step: step is an integer in 1..120
     '''
-    bpy.ops.object.select_all(action='DESELECT') #prevent unintentionally baking something
-    select(nameRoot)
-    bpy.ops.rigidbody.bake_to_keyframes(frame_start= startFrame,
-        frame_end= endFrame, step= step)
+    #the operator only bakes active rigid bodies; it cannot skip others that
+    #are passed through context, so leave them out here
+    all= [o for o in _getObjList(nameRoot)
+        if o.rigid_body and o.rigid_body.type == 'ACTIVE']
+    if not all:
+        return
+    if hasattr(bpy.context, 'temp_override'): #Blender 3.2 and later
+        #pass the objects to bake through context instead of selecting them
+        override= {'selected_objects': all, 'active_object': all[0],
+            'object': all[0], 'scene': bpy.context.scene}
+        with bpy.context.temp_override(**override):
+            bpy.ops.rigidbody.bake_to_keyframes(frame_start= startFrame,
+                frame_end= endFrame, step= step)
+    else:
+        #operators called by the bake do not see a context dict, so select
+        selected= _selectOnly(all) #prevent unintentionally baking something
+        c= bpy.context.view_layer.objects
+        active= c.active
+        c.active= all[0]
+        try:
+            bpy.ops.rigidbody.bake_to_keyframes(frame_start= startFrame,
+                frame_end= endFrame, step= step)
+        finally:
+            c.active= active
+            _restoreSelection(all, selected)
 
 
 def copy_rigidbody_settings(nameRoot, template):
@@ -135,10 +263,13 @@ def copy_rigidbody_settings(nameRoot, template):
     Parameter template: template is a string
     Precondition: There exists a rigid body object named template in the scene
     '''
-    bpy.ops.object.select_all(action='DESELECT') #prevent unintentional application
-    bpy.context.view_layer.objects.active= bpy.data.objects[template]
-    select(nameRoot)
-    bpy.ops.rigidbody.object_settings_copy()
+    all= _getObjList(nameRoot)
+    selected= _selectOnly(all) #prevent unintentional application
+    try:
+        bpy.context.view_layer.objects.active= bpy.data.objects[template]
+        bpy.ops.rigidbody.object_settings_copy()
+    finally:
+        _restoreSelection(all, selected)
 
 
 def assign_material(nameRoot, material):
@@ -152,17 +283,8 @@ def assign_material(nameRoot, material):
     Precondition: There exists a material named material
     '''
     m= bpy.data.materials.get(material)
-    cv= bpy.context.view_layer.objects
-    co= bpy.context.object
     all= _getObjList(nameRoot)
     for o in all:
-        #delete all material slots
-        cv.active= o
-        totalSlots= len(co.material_slots)
-        while totalSlots != 0:
-            co.active_material_index= 0
-            bpy.ops.object.material_slot_remove()
-            totalSlots -= 1
-        #assign material
+        #delete all material slots, then assign material
+        o.data.materials.clear()
         o.data.materials.append(m)
-    cv.active= None
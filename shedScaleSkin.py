@@ -17,14 +17,51 @@ Author: Helen Lily Hu
 2019
 '''
 import bpy
-import bmesh
-import mathutils
+import numpy as np
 
 
 originalObjectName= 'Cube'  #replace w/name of your object
 SCALE_THICKNESS= 0.05       #alter as you wish
 DISPLACEMENT_DISTANCE= 1    #alter as you wish
 
+#Every scale is a prism with the same topology: verts 0-3 are the copied
+#face, verts 4-7 are the same verts moved outwards
+SCALE_FACES= ((4, 5, 6, 7), (3, 2, 1, 0),
+    (0, 1, 5, 4), (1, 2, 6, 5), (2, 3, 7, 6), (3, 0, 4, 7))
+SCALE_LOOP_VERTS= np.array(SCALE_FACES, dtype= np.int32).ravel()
+SCALE_LOOP_STARTS= np.arange(0, len(SCALE_LOOP_VERTS), 4, dtype= np.int32)
+SCALE_LOOP_TOTALS= np.full(len(SCALE_FACES), 4, dtype= np.int32)
+#index into the face's 4 UVs for every loop of SCALE_FACES; loop k of
+#every scale face gets the face's k-th UV
+SCALE_LOOP_CORNERS= np.tile(np.arange(4), len(SCALE_FACES))
+
+
+def build_scale_verts(faceCoords, origin, thickness, displacement, outVerts, outLocs):
+    '''
+    Compute the geometry of every scale, for all faces at once.
+
+    outVerts[i] is set to the 8 verts of face i's scale, relative to the
+    scale's median. outLocs[i] is set to the location of face i's scale.
+
+    Parameter faceCoords: faceCoords is a (F, 4, 3) array of face vert coordinates
+    Parameter origin: origin is a (3,) array; scales move away from origin
+    Parameter thickness: thickness is a number
+    Parameter displacement: displacement is a number
+    Parameter outVerts: outVerts is a (F, 8, 3) array
+    Parameter outLocs: outLocs is a (F, 3) array
+    '''
+    #direction from origin to every face center
+    centers= faceCoords.mean(axis= 1)
+    vecs= centers - origin
+    lengths= np.linalg.norm(vecs, axis= 1, keepdims= True)
+    vecs /= np.where(lengths == 0, 1, lengths)
+    #the median of each prism lies halfway up the extrusion
+    halves= (vecs * (thickness / 2))[:, np.newaxis]
+    relCoords= faceCoords - centers[:, np.newaxis]
+    outVerts[:, :4]= relCoords - halves
+    outVerts[:, 4:]= relCoords + halves
+    outLocs[:]= centers + vecs * (thickness / 2 + displacement)
+
 
 #select original object and only that object
 bpy.ops.object.mode_set(mode='OBJECT')
@@ -32,58 +69,79 @@ bpy.ops.object.select_all(action='DESELECT')
 o= bpy.data.objects[originalObjectName]
 o.select_set(True)
 
-#create BMesh out of object mesh to modify with edit mode operations
-oBM= bmesh.new()
+#gather vertex coordinates of object mesh
 oM= o.data
-oBM.from_mesh(oM)
-#transform BMesh to global coordinates based on object (in case of scaling issues)
-bmesh.ops.transform(oBM, matrix= o.matrix_world, verts= oBM.verts)
-
-oLoc= mathutils.Vector(o.location)
-faceNum= 0
+coords= np.empty(len(oM.vertices) * 3, dtype= np.float32)
+oM.vertices.foreach_get("co", coords)
+#transform to global coordinates based on object (in case of scaling issues)
+mw= np.array(o.matrix_world, dtype= np.float32)
+coords= coords.reshape(-1, 3) @ mw[:3, :3].T + mw[:3, 3]
+
+oLoc= np.array(o.location, dtype= np.float32)
+polygons= oM.polygons
+
+#gather per-loop data of every (quad) face into (F, 4) arrays
+loopTotals= np.empty(len(polygons), dtype= np.int32)
+polygons.foreach_get("loop_total", loopTotals)
+if (loopTotals != 4).any():
+    raise ValueError(originalObjectName + " has " + str((loopTotals != 4).sum())
+        + " faces that are not quads, starting at face "
+        + str(np.flatnonzero(loopTotals != 4)[0]))
+loopStarts= np.empty(len(polygons), dtype= np.int32)
+polygons.foreach_get("loop_start", loopStarts)
+faceLoops= loopStarts[:, np.newaxis] + np.arange(4)
+loopVerts= np.empty(len(oM.loops), dtype= np.int32)
+oM.loops.foreach_get("vertex_index", loopVerts)
+faceCoords= coords[loopVerts[faceLoops]]
+loopUVs= np.empty(len(oM.loops) * 2, dtype= np.float32)
+oM.uv_layers.active.data.foreach_get("uv", loopUVs)
+#face UV coordinates for every loop of every scale
+scaleUVs= loopUVs.reshape(-1, 2)[faceLoops][:, SCALE_LOOP_CORNERS]
+
+#material of every face
+faceMats= np.empty(len(polygons), dtype= np.int32)
+polygons.foreach_get("material_index", faceMats)
+mats= list(oM.materials)
+
+#compute all scale geometry up front, away from the Blender API
+scaleVerts= np.empty((len(polygons), 8, 3), dtype= np.float32)
+scaleLocs= np.empty((len(polygons), 3), dtype= np.float32)
+build_scale_verts(faceCoords, oLoc, SCALE_THICKNESS, DISPLACEMENT_DISTANCE, scaleVerts, scaleLocs)
+
+scaleObjects= [] #linked to the scene after all scales are made
 #For each face of the object:
-for face in oBM.faces:
-    #Create a new BMesh for this scale; copy data from face
-    sBM= bmesh.new()
-    for v in face.verts:
-        sBM.verts.new(v.co)
-    scale= sBM.faces.new(sBM.verts)
-
-    #Extrude outwards a little so the BMesh has volume/is a prism
-    extruded= bmesh.ops.extrude_face_region(sBM, geom= [scale])
-    extrusionVerts= [v for v in extruded['geom'] if isinstance(v, bmesh.types.BMVert)]
-    vecOtoS= scale.calc_center_median() - oLoc
-    vecOtoS.normalize()
-    bmesh.ops.translate(sBM, vec= vecOtoS * SCALE_THICKNESS, verts= extrusionVerts)
-
-    #assign face UV coordinates to all of the scale's faces
-    uvLayer = sBM.loops.layers.uv.new()
-    for loop in face.loops:
-        loopIndex= loop.index
-        faceUV= oM.uv_layers.active.data[loopIndex].uv
-        for sFace in sBM.faces:
-            sFace.loops[loopIndex % 4][uvLayer].uv= faceUV
-
-    #Write BMesh into a new scale mesh
+for faceNum in range(len(polygons)):
+    #Write geometry into a new scale mesh
     sName= "scale" + originalObjectName + str(faceNum)
-    faceNum += 1
     sM= bpy.data.meshes.new(sName)
-    sBM.to_mesh(sM)
-    sBM.free() #free mesh explicitly to prevent trash pile up
+    sM.vertices.add(8)
+    sM.loops.add(len(SCALE_LOOP_VERTS))
+    sM.polygons.add(len(SCALE_FACES))
+    sM.vertices.foreach_set("co", scaleVerts[faceNum].ravel())
+    sM.loops.foreach_set("vertex_index", SCALE_LOOP_VERTS)
+    sM.polygons.foreach_set("loop_start", SCALE_LOOP_STARTS)
+    sM.polygons.foreach_set("loop_total", SCALE_LOOP_TOTALS)
 
-    #Add new scale object that references scale mesh to scene
+    #assign face UV coordinates to all of the scale's faces
+    sM.uv_layers.new().data.foreach_set("uv", scaleUVs[faceNum].ravel())
+    sM.update(calc_edges= True)
+
+    #Add new scale object that references scale mesh
     sO= bpy.data.objects.new(sName, sM)
-    bpy.context.collection.objects.link(sO)
+    scaleObjects.append(sO)
 
-    #Move each scale object away from the original object
-    bpy.ops.object.select_all(action='DESELECT')
-    sO.select_set(True)
-    bpy.ops.object.origin_set(type= 'ORIGIN_GEOMETRY') #center scale origin
-    bpy.ops.transform.translate(value= vecOtoS * DISPLACEMENT_DISTANCE)
+    #Place each scale object away from the original object
+    sO.location= scaleLocs[faceNum]
 
     #apply face material to scale object
-    sO.data.materials.append(bpy.data.materials[face.material_index])
+    if mats:
+        #Blender clamps material indices left over from removed slots
+        sM.materials.append(mats[min(faceMats[faceNum], len(mats) - 1)])
+
+#Add all scale objects to scene in one pass
+link= bpy.context.collection.objects.link
+for sO in scaleObjects:
+    link(sO)
 
 #clean up
-oBM.free()
 bpy.ops.object.select_all(action='DESELECT')